@@ -16,14 +16,19 @@
 
 import os
 import re
+import hashlib
 import shutil
+import tempfile
 from pathlib import Path
 from datetime import datetime
 from collections import OrderedDict
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # Проверка зависимостей
 try:
     import markdown
+    from markdown.extensions.toc import TocExtension, slugify_unicode
     from weasyprint import HTML, CSS
     from weasyprint.text.fonts import FontConfiguration
 except ImportError as e:
@@ -35,15 +40,184 @@ except ImportError as e:
     exit(1)
 
 
+# Размер буфера временного HTML-файла, который передаётся в WeasyPrint
+_PDF_HTML_BUFFER_SIZE = 128 * 1024
+
+# Шапка и футер глав в /book/
+_BOOK_NAV_HEADER = """[← К оглавлению](README.md)
+
+---
+
+"""
+_BOOK_FOOTER_TEMPLATE = """
+
+---
+
+[← К оглавлению](README.md)
+
+*Глава {full_num}: {title}*
+"""
+
+# Служебные ## заголовки, которые не попадают в оглавление PDF
+_SERVICE_H2_TITLES = frozenset({
+    'введение', 'ключевые термины', 'контрольные вопросы', 'резюме',
+    'связь с другими темами', 'связь с другими главами',
+})
+
+# Файл-отметка для инкрементальной пересборки /book/. Лежит рядом со
+# скриптом, а не в публикуемой /book/, и указан в .gitignore
+_BUILD_STAMP_PATH = Path(__file__).with_name(".build_stamp")
+
+# Скомпилированные шаблоны (компилируются один раз при загрузке модуля)
+
+# Префикс "Глава X.Y: " в заголовке главы
+_TITLE_PREFIX_RE = re.compile(r'^Глава \d+\.\d+[:\s]*')
+
+# Ссылки между главами для /book/ (все три вида упоминаний за один проход):
+# **Глава X.Y**, [Глава X.Y] без ссылки и Глава/глава/главе X.Y в тексте.
+# Опережающая проверка первого символа даёт движку префикс-множество,
+# и он пропускает неподходящие позиции, не перебирая три ветки
+_CHAPTER_MENTION_RE = re.compile(
+    r'(?=[*\[Гг])(?:'
+    r'(?P<bold>\*\*Глава (\d+)\.(\d+)\*\*(?!\]))'
+    r'|(?P<bracket>\[Глава (\d+)\.(\d+)\](?!\())'
+    r'|(?P<plain>(?<![\[*])([Гг]лав[аеуы]) (\d+)\.(\d+)(?!\]))'
+    r')'
+)
+
+# Ссылки и заголовки для PDF
+# [Глава X.Y](...) и [**Глава X.Y**](...) за один проход
+_PDF_CHAPTER_LINK_RE = re.compile(r'\[(?P<bold>\*\*)?Глава (\d+)\.(\d+)(?(bold)\*\*)\]\([^)]+\)')
+# Признаки блока кода (``` / ~~~ или строка с отступом): такой главе нужен codehilite
+_CODE_BLOCK_HINT_RE = re.compile(r'^(?:```|~~~|    |\t)', re.MULTILINE)
+
+
+def _write_if_changed(path, content):
+    """Запись файла, только если его содержимое изменилось (git status остаётся чистым)
+    
+    Файл пишется во временный рядом и подменяется через os.replace, поэтому
+    читатель (например, локальный сервер Docsify) не увидит его наполовину записанным.
+    """
+    data = content.encode('utf-8')
+    if path.exists() and path.read_bytes() == data:
+        return False
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+@dataclass(slots=True)
+class ChapterInfo:
+    """Описание одной главы (заполняется в parse_chapters)"""
+    section_num: str
+    chapter_num: str
+    full_num: str
+    slug: str
+    title: str
+    filename: str
+    path: str
+    content: str | None = None
+    # Имя файла в /book/ (и относительная ссылка внутри /book/)
+    link_url: str = ""
+    # Ссылка от корня репозитория (README.md, _sidebar.md)
+    book_link: str = ""
+    # Якорь главы в PDF
+    anchor_id: str = ""
+    # HTML главы и её ## заголовки из toc (заполняются в generate_pdf)
+    html: str | None = None
+    h2_headings: list = field(default_factory=list)
+
+
+class _ChapterHtmlConverter:
+    """Конвертер глав Markdown -> HTML для PDF
+    
+    Расширения загружаются один раз, между главами состояние сбрасывается
+    через reset(). Облегчённый конвертер (без codehilite) - для глав без
+    блоков кода. ID заголовков строит toc с префиксом текущей главы, чтобы
+    они были уникальны в общем HTML.
+    """
+    
+    def __init__(self):
+        self._toc_prefix = ""
+        self._md_full = markdown.Markdown(extensions=[
+            'extra', 'codehilite', 'tables', self._make_toc_extension(), 'attr_list'
+        ])
+        self._md_lite = markdown.Markdown(extensions=[
+            'extra', 'tables', self._make_toc_extension(), 'attr_list'
+        ])
+    
+    def _make_toc_extension(self):
+        """Расширение toc с ID вида <якорь главы>_<слаг заголовка>"""
+        return TocExtension(
+            permalink=False,
+            slugify=lambda value, separator: self._toc_prefix + slugify_unicode(value, separator),
+        )
+    
+    def convert(self, content, anchor_id):
+        """Конвертация одной главы: возвращает HTML и ## заголовки из toc"""
+        
+        # Конвертируем ссылки на главы в относительные якоря
+        def convert_pdf_links(match):
+            section = match.group(2)
+            chapter_num = match.group(3)
+            target_id = f"chapter_{section.zfill(2)}_{chapter_num.zfill(2)}"
+            link_text = f"Глава {section}.{chapter_num}"
+            if match.group('bold'):
+                link_text = f"<strong>{link_text}</strong>"
+            return f'<a href="#{target_id}">{link_text}</a>'
+        
+        # Заменяем [Глава X.Y](...) и [**Глава X.Y**](...) на внутренние ссылки
+        content = _PDF_CHAPTER_LINK_RE.sub(convert_pdf_links, content)
+        
+        # Конвертируем markdown в HTML с якорями для подразделов
+        md = self._md_full if _CODE_BLOCK_HINT_RE.search(content) else self._md_lite
+        self._toc_prefix = f"{anchor_id}_"
+        html = md.reset().convert(content)
+        
+        # Подразделы для оглавления берём из уже построенного toc
+        h2_headings = []
+        # Обход в глубину стеком: порядок токенов совпадает с порядком в тексте
+        pending = list(reversed(md.toc_tokens))
+        while pending:
+            token = pending.pop()
+            if token['level'] == 2:
+                h2_headings.append(token)
+            pending.extend(reversed(token['children']))
+        
+        return html, h2_headings
+
+
+# Конвертер процесса-воркера (создаётся один раз в _init_pdf_worker)
+_worker_converter = None
+
+
+def _init_pdf_worker():
+    """Инициализация процесса-воркера для конвертации глав в HTML"""
+    global _worker_converter
+    _worker_converter = _ChapterHtmlConverter()
+
+
+def _convert_chapter_in_worker(content, anchor_id):
+    """Конвертация главы в HTML внутри процесса-воркера"""
+    return _worker_converter.convert(content, anchor_id)
+
+
 class TextbookBuilder:
     """Класс для сборки учебника в разные форматы"""
     
-    def __init__(self, chapters_dir="chapters", output_dir="book"):
+    def __init__(self, chapters_dir="chapters", output_dir="book", verbose=False):
         self.chapters_dir = Path(chapters_dir)
         self.output_dir = Path(output_dir)
+        # Печатать ли строку на каждую главу (по умолчанию только итог)
+        self._verbose = verbose
         self.root_dir = Path(".")
         self.chapters = []
         self.toc_structure = OrderedDict()
+        self._chapter_index = {}
+        # Ресурсы WeasyPrint (создаются лениво в generate_pdf)
+        self._font_config = None
+        self._bookmark_css = None
         
     def parse_chapters(self):
         """Парсинг всех глав и построение структуры"""
@@ -53,6 +227,10 @@ class TextbookBuilder:
             print(f"❌ ОШИБКА: Папка {self.chapters_dir} не найдена!")
             return False
         
+        # Повторный build() на том же экземпляре не должен дублировать главы
+        self.chapters = []
+        self.toc_structure = OrderedDict()
+        
         # Структура разделов (из spec.md)
         sections = {
             "01": "Понятие информации",
@@ -66,40 +244,56 @@ class TextbookBuilder:
             "09": "Защита информации"
         }
         
-        chapter_files = sorted(self.chapters_dir.glob("*.md"))
+        # Плоская папка: scandir быстрее glob и не создаёт Path на каждый файл
+        with os.scandir(self.chapters_dir) as it:
+            chapter_files = sorted(
+                (e for e in it if e.is_file(follow_symlinks=False) and e.name.endswith('.md')),
+                key=lambda e: e.name,
+            )
         
         for chapter_file in chapter_files:
-            # Парсим имя файла: 01_02_название.md
-            match = re.match(r'(\d{2})_(\d{2})_(.+)\.md', chapter_file.name)
-            if not match:
+            # Парсим имя файла: 01_02_название.md (формат жёсткий, regex не нужен)
+            name = chapter_file.name
+            if len(name) < 10 or name[2] != '_' or name[5] != '_':
                 continue
-                
-            section_num = match.group(1)
-            chapter_num = match.group(2)
-            chapter_slug = match.group(3)
             
-            # Читаем заголовок главы
+            section_num = name[:2]
+            chapter_num = name[3:5]
+            if not (section_num.isdecimal() and chapter_num.isdecimal()):
+                continue
+            chapter_slug = name[6:-3]
+            
+            # Читаем главу целиком один раз и берём заголовок из первой строки
+            content = None
             try:
-                with open(chapter_file, 'r', encoding='utf-8') as f:
-                    first_line = f.readline().strip()
-                    if first_line.startswith('# '):
-                        title = first_line[2:].strip()
-                        # Убираем "Глава X.Y: " если есть
-                        title = re.sub(r'^Глава \d+\.\d+[:\s]*', '', title)
-                    else:
-                        title = chapter_slug.replace('_', ' ').title()
+                # Небуферизованное бинарное чтение: open + fstat + read без TextIOWrapper
+                with open(chapter_file.path, 'rb', buffering=0) as f:
+                    content = f.read().decode('utf-8')
+                # Срез до первого '\n' не копирует остаток главы (в отличие от split/partition)
+                line_end = content.find('\n')
+                first_line = (content if line_end < 0 else content[:line_end]).strip()
+                if first_line.startswith('# '):
+                    title = first_line[2:].strip()
+                    # Убираем "Глава X.Y: " если есть
+                    title = _TITLE_PREFIX_RE.sub('', title)
+                else:
+                    title = chapter_slug.replace('_', ' ').title()
             except:
                 title = chapter_slug.replace('_', ' ').title()
             
-            chapter_info = {
-                'section_num': section_num,
-                'chapter_num': chapter_num,
-                'full_num': f"{int(section_num)}.{int(chapter_num)}",
-                'slug': chapter_slug,
-                'title': title,
-                'filename': chapter_file.name,
-                'path': chapter_file
-            }
+            chapter_info = ChapterInfo(
+                section_num=section_num,
+                chapter_num=chapter_num,
+                full_num=f"{int(section_num)}.{int(chapter_num)}",
+                slug=chapter_slug,
+                title=title,
+                filename=chapter_file.name,
+                path=chapter_file.path,
+                content=content,
+                link_url=f"{section_num}_{chapter_num}_{chapter_slug}.md",
+                book_link=f"/book/{section_num}_{chapter_num}_{chapter_slug}.md",
+                anchor_id=f"chapter_{section_num}_{chapter_num}",
+            )
             
             self.chapters.append(chapter_info)
             
@@ -112,6 +306,9 @@ class TextbookBuilder:
                 }
             self.toc_structure[section_num]['chapters'].append(chapter_info)
         
+        # Индекс для быстрого поиска главы по номеру
+        self._chapter_index = {(c.section_num, c.chapter_num): c for c in self.chapters}
+        
         print(f"  ✅ Найдено {len(self.chapters)} глав в {len(self.toc_structure)} разделах")
         return True
     
@@ -119,7 +316,7 @@ class TextbookBuilder:
         """Генерация README.md в корне с оглавлением"""
         print("\n📝 Генерация README.md...")
         
-        readme_content = f"""# Учебник по информатике
+        parts = [f"""# Учебник по информатике
 
 **Для студентов первого курса технических специальностей**
 
@@ -137,17 +334,16 @@ class TextbookBuilder:
 
 ## 📚 Оглавление
 
-"""
+"""]
         
         for section_num, section_data in self.toc_structure.items():
-            readme_content += f"\n### Раздел {int(section_num)}: {section_data['name']}\n\n"
+            parts.append(f"\n### Раздел {int(section_num)}: {section_data['name']}\n\n")
             
             for chapter in section_data['chapters']:
                 # Ссылка на файл в /book/
-                link = f"/book/{chapter['section_num']}_{chapter['chapter_num']}_{chapter['slug']}.md"
-                readme_content += f"{int(chapter['chapter_num'])}. [**{chapter['title']}**]({link})\n"
+                parts.append(f"{int(chapter.chapter_num)}. [**{chapter.title}**]({chapter.book_link})\n")
         
-        readme_content += f"""
+        parts.append(f"""
 ---
 
 ## 📊 Статистика
@@ -189,61 +385,44 @@ python build_script.py
 ---
 
 *Автоматически сгенерировано скриптом build_script.py*
-"""
+""")
+        readme_content = ''.join(parts)
         
         readme_path = self.root_dir / "README.md"
-        with open(readme_path, 'w', encoding='utf-8') as f:
-            f.write(readme_content)
+        _write_if_changed(readme_path, readme_content)
         
         print(f"  ✅ Создан: {readme_path}")
         return True
     
+    def find_target_chapter(self, section, chapter_num):
+        """Находит главу по номеру раздела и главы (поиск по индексу, O(1))"""
+        return self._chapter_index.get((section.zfill(2), chapter_num.zfill(2)))
+    
     def convert_chapter_links(self, content, current_chapter):
         """Конвертация упоминаний глав в кликабельные ссылки"""
         
-        def find_target_chapter(section, chapter_num):
-            """Находит главу по номеру раздела и главы"""
-            for ch in self.chapters:
-                if ch['section_num'] == section.zfill(2) and ch['chapter_num'] == chapter_num.zfill(2):
-                    return ch
-            return None
-        
-        # 1. Обработка **Глава X.Y** (жирные без ссылок)
-        def replace_bold_chapter(match):
-            section = match.group(1)
-            chapter_num = match.group(2)
-            target = find_target_chapter(section, chapter_num)
-            if not target:
-                return match.group(0)
-            link_url = f"{target['section_num']}_{target['chapter_num']}_{target['slug']}.md"
-            return f"[**Глава {section}.{chapter_num}**]({link_url})"
-        
-        content = re.sub(r'\*\*Глава (\d+)\.(\d+)\*\*(?!\])', replace_bold_chapter, content)
-        
-        # 2. Обработка [Глава X.Y] без ссылки после (не [Глава X.Y](...))
-        def replace_bracket_chapter(match):
-            section = match.group(1)
-            chapter_num = match.group(2)
-            target = find_target_chapter(section, chapter_num)
-            if not target:
-                return match.group(0)
-            link_url = f"{target['section_num']}_{target['chapter_num']}_{target['slug']}.md"
-            return f"[Глава {section}.{chapter_num}]({link_url})"
-        
-        content = re.sub(r'\[Глава (\d+)\.(\d+)\](?!\()', replace_bracket_chapter, content)
-        
-        # 3. Обработка обычных упоминаний: Глава/глава/главе X.Y (не в ссылках)
-        def replace_plain_chapter(match):
-            case_word = match.group(1)  # Глава/глава/главе/главы
-            section = match.group(2)
-            chapter_num = match.group(3)
-            target = find_target_chapter(section, chapter_num)
+        def replace_chapter_mention(match):
+            kind = match.lastgroup
+            if kind == 'bold':
+                # **Глава X.Y** (жирные без ссылок)
+                section, chapter_num = match.group(2, 3)
+                text = f"**Глава {section}.{chapter_num}**"
+            elif kind == 'bracket':
+                # [Глава X.Y] без ссылки после (не [Глава X.Y](...))
+                section, chapter_num = match.group(5, 6)
+                text = f"Глава {section}.{chapter_num}"
+            else:
+                # Обычные упоминания: Глава/глава/главе X.Y (не в ссылках)
+                case_word, section, chapter_num = match.group(8, 9, 10)
+                text = f"{case_word} {section}.{chapter_num}"
+            
+            target = self.find_target_chapter(section, chapter_num)
             if not target:
                 return match.group(0)
-            link_url = f"{target['section_num']}_{target['chapter_num']}_{target['slug']}.md"
-            return f"[{case_word} {section}.{chapter_num}]({link_url})"
+            link_url = target.link_url
+            return f"[{text}]({link_url})"
         
-        content = re.sub(r'(?<!\[|\*)([Гг]лав[аеуы]) (\d+)\.(\d+)(?!\])', replace_plain_chapter, content)
+        content = _CHAPTER_MENTION_RE.sub(replace_chapter_mention, content)
         
         return content
     
@@ -251,13 +430,32 @@ python build_script.py
         """Экспорт глав в /book/ с конвертацией ссылок"""
         print("\n📁 Экспорт глав в /book/...")
         
-        # Создаём папку /book/
-        if self.output_dir.exists():
-            shutil.rmtree(self.output_dir)
-        self.output_dir.mkdir()
+        # Создаём папку /book/ (содержимое не удаляем: пересобираем только изменённое)
+        self.output_dir.mkdir(exist_ok=True)
+        
+        # Удаляем устаревшие файлы, для которых больше нет исходной главы
+        expected_names = {chapter.link_url for chapter in self.chapters}
+        expected_names.add("README.md")
+        for path in self.output_dir.iterdir():
+            if path.name in expected_names:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        
+        # Если изменился состав глав, их названия или шаблоны шапки/футера,
+        # ссылки могут измениться в любой главе - тогда пересобираем всё
+        stamp = self._book_stamp()
+        stamp_path = _BUILD_STAMP_PATH
+        stamp_unchanged = stamp_path.exists() and stamp_path.read_text(encoding='utf-8') == stamp
+        stale_chapters = [
+            chapter for chapter in self.chapters
+            if not (stamp_unchanged and self._is_chapter_up_to_date(chapter))
+        ]
         
         # Создаём README.md для /book/
-        book_readme = f"""# Учебник по информатике
+        parts = [f"""# Учебник по информатике
 
 [← Вернуться к главному оглавлению](../README.md)
 
@@ -265,61 +463,75 @@ python build_script.py
 
 ## Оглавление
 
-"""
+"""]
         
         for section_num, section_data in self.toc_structure.items():
-            book_readme += f"\n### Раздел {int(section_num)}: {section_data['name']}\n\n"
+            parts.append(f"\n### Раздел {int(section_num)}: {section_data['name']}\n\n")
             
             for chapter in section_data['chapters']:
-                link = f"{chapter['section_num']}_{chapter['chapter_num']}_{chapter['slug']}.md"
-                book_readme += f"{int(chapter['chapter_num'])}. [{chapter['title']}]({link})\n"
+                parts.append(f"{int(chapter.chapter_num)}. [{chapter.title}]({chapter.link_url})\n")
         
-        book_readme += "\n---\n\n*Автоматически сгенерировано*\n"
+        parts.append("\n---\n\n*Автоматически сгенерировано*\n")
+        book_readme = ''.join(parts)
         
-        with open(self.output_dir / "README.md", 'w', encoding='utf-8') as f:
-            f.write(book_readme)
+        _write_if_changed(self.output_dir / "README.md", book_readme)
         
-        # Копируем и конвертируем каждую главу
-        for chapter in self.chapters:
-            source_path = chapter['path']
-            target_filename = f"{chapter['section_num']}_{chapter['chapter_num']}_{chapter['slug']}.md"
-            target_path = self.output_dir / target_filename
-            
-            # Читаем исходный файл
-            with open(source_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            # Конвертируем ссылки на главы
-            content = self.convert_chapter_links(content, chapter)
-            
-            # Добавляем шапку с навигацией
-            nav_header = f"""[← К оглавлению](README.md)
-
----
-
-"""
-            content = nav_header + content
-            
-            # Добавляем футер
-            footer = f"""
-
----
-
-[← К оглавлению](README.md)
-
-*Глава {chapter['full_num']}: {chapter['title']}*
-"""
-            content = content + footer
-            
-            # Сохраняем
-            with open(target_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            print(f"  ✅ {target_filename}")
+        # Отметку снимаем на время записи, чтобы прерванная сборка
+        # не считалась актуальной при следующем запуске
+        if stale_chapters and stamp_path.exists():
+            stamp_path.unlink()
         
-        print(f"\n  ✅ Экспортировано {len(self.chapters)} глав в /book/")
+        # Копируем и конвертируем главы параллельно: главы независимы,
+        # а _chapter_index после parse_chapters только читается
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for target_filename in executor.map(self._process_one_chapter, stale_chapters):
+                if self._verbose:
+                    print(f"  ✅ {target_filename}")
+        
+        stamp_path.write_text(stamp, encoding='utf-8')
+        
+        skipped = len(self.chapters) - len(stale_chapters)
+        print(f"\n  ✅ Экспортировано {len(stale_chapters)} глав в /book/ (без изменений: {skipped})")
         return True
     
+    def _book_stamp(self):
+        """Хеш всего, от чего зависит каждая глава в /book/, кроме её исходника"""
+        digest = hashlib.blake2b(digest_size=16)
+        for chapter in self.chapters:
+            key = (chapter.section_num, chapter.chapter_num, chapter.slug, chapter.title)
+            digest.update(repr(key).encode('utf-8'))
+        # Исходник сборщика покрывает шаблоны, регулярные выражения и логику
+        # замены ссылок: любая правка скрипта пересобирает /book/ целиком
+        digest.update(Path(__file__).read_bytes())
+        return digest.hexdigest()
+    
+    def _is_chapter_up_to_date(self, chapter):
+        """Проверка, что глава в /book/ не старше исходника"""
+        target_path = self.output_dir / chapter.link_url
+        try:
+            return target_path.stat().st_mtime >= os.stat(chapter.path).st_mtime
+        except FileNotFoundError:
+            return False
+    
+    def _process_one_chapter(self, chapter):
+        """Конвертация и запись одной главы в /book/"""
+        target_filename = chapter.link_url
+        target_path = self.output_dir / target_filename
+        
+        # Конвертируем ссылки на главы (текст уже прочитан в parse_chapters)
+        content = self.convert_chapter_links(chapter.content, chapter)
+        
+        # Добавляем шапку с навигацией и футер
+        footer = _BOOK_FOOTER_TEMPLATE.format(full_num=chapter.full_num, title=chapter.title)
+        content = _BOOK_NAV_HEADER + content + footer
+        
+        # Сохраняем; если текст не изменился, только обновляем mtime,
+        # чтобы глава считалась актуальной при следующей сборке
+        if not _write_if_changed(target_path, content):
+            os.utime(target_path)
+        
+        return target_filename
+    
     def setup_github_pages(self):
         """Настройка GitHub Pages с Docsify"""
         print("\n🌐 Настройка GitHub Pages (Docsify)...")
@@ -526,23 +738,22 @@ python build_script.py
 </html>
 """
         
-        with open(self.root_dir / "index.html", 'w', encoding='utf-8') as f:
-            f.write(index_html)
+        _write_if_changed(self.root_dir / "index.html", index_html)
         
         # Создаём _sidebar.md для Docsify (компактное дерево оглавления)
-        sidebar_content = ""
+        parts = []
         
         for section_num, section_data in self.toc_structure.items():
             # Раздел как подзаголовок (не кликабельный)
-            sidebar_content += f"* **{int(section_num)}. {section_data['name']}**\n"
+            parts.append(f"* **{int(section_num)}. {section_data['name']}**\n")
             
             for chapter in section_data['chapters']:
-                link = f"/book/{chapter['section_num']}_{chapter['chapter_num']}_{chapter['slug']}.md"
                 # Главы с отступом
-                sidebar_content += f"  * [{chapter['full_num']} {chapter['title']}]({link})\n"
+                parts.append(f"  * [{chapter.full_num} {chapter.title}]({chapter.book_link})\n")
+        
+        sidebar_content = ''.join(parts)
         
-        with open(self.root_dir / "_sidebar.md", 'w', encoding='utf-8') as f:
-            f.write(sidebar_content)
+        _write_if_changed(self.root_dir / "_sidebar.md", sidebar_content)
         
         print("  ✅ Создан index.html")
         print("  ✅ Создан _sidebar.md")
@@ -555,7 +766,7 @@ python build_script.py
         print("\n📄 Генерация PDF...")
         
         # Собираем HTML-контент
-        html_content = f"""<!DOCTYPE html>
+        parts = [f"""<!DOCTYPE html>
 <html lang="ru">
 <head>
     <meta charset="UTF-8">
@@ -714,98 +925,75 @@ python build_script.py
     
     <div class="toc">
         <h1>ОГЛАВЛЕНИЕ</h1>
-"""
+"""]
+        
+        # Конвертируем главы в HTML один раз: заодно собираем ## заголовки
+        # для оглавления, чтобы не сканировать исходники повторно.
+        # Главы независимы, поэтому конвертируем их параллельно в процессах
+        contents = [chapter.content for chapter in self.chapters]
+        anchor_ids = [chapter.anchor_id for chapter in self.chapters]
+        with ProcessPoolExecutor(initializer=_init_pdf_worker) as executor:
+            results = executor.map(_convert_chapter_in_worker, contents, anchor_ids, chunksize=4)
+            for chapter, (html_chapter, h2_headings) in zip(self.chapters, results):
+                chapter.html = html_chapter
+                chapter.h2_headings = h2_headings
         
         # Оглавление с подразделами
         for section_num, section_data in self.toc_structure.items():
-            html_content += f'<div class="toc-section">Раздел {int(section_num)}: {section_data["name"]}</div>\n'
+            parts.append(f'<div class="toc-section">Раздел {int(section_num)}: {section_data["name"]}</div>\n')
             
             for chapter in section_data['chapters']:
-                chapter_id = f"chapter_{chapter['section_num']}_{chapter['chapter_num']}"
-                html_content += f'<div class="toc-chapter">{chapter["full_num"]}. <a href="#{chapter_id}">{chapter["title"]}</a></div>\n'
+                chapter_id = chapter.anchor_id
+                parts.append(f'<div class="toc-chapter">{chapter.full_num}. <a href="#{chapter_id}">{chapter.title}</a></div>\n')
                 
                 # Добавляем подразделы (## заголовки)
-                try:
-                    with open(chapter['path'], 'r', encoding='utf-8') as f:
-                        chapter_content = f.read()
-                    
-                    # Ищем заголовки уровня 2 (##)
-                    h2_pattern = r'^## (.+)$'
-                    h2_matches = re.finditer(h2_pattern, chapter_content, re.MULTILINE)
-                    
-                    for i, match in enumerate(h2_matches):
-                        h2_title = match.group(1).strip()
-                        # Пропускаем служебные заголовки
-                        if h2_title.lower() in ['введение', 'ключевые термины', 'контрольные вопросы', 'резюме', 'связь с другими темами', 'связь с другими главами']:
-                            continue
-                        h2_id = f"{chapter_id}_h2_{i}"
-                        html_content += f'<div class="toc-subchapter"><a href="#{h2_id}">{h2_title}</a></div>\n'
-                except:
-                    pass  # Если не удалось прочитать главу, пропускаем
-        
-        html_content += "</div>\n\n"
-        
-        # Главы с bookmarks для PDF
+                for token in chapter.h2_headings:
+                    # Пропускаем служебные заголовки
+                    if token['name'].lower() in _SERVICE_H2_TITLES:
+                        continue
+                    parts.append(f'<div class="toc-subchapter"><a href="#{token["id"]}">{token["html"]}</a></div>\n')
+        
+        parts.append("</div>\n\n")
+        
+        # Главы с bookmarks для PDF (HTML главы больше не нужен на ChapterInfo)
         for chapter in self.chapters:
-            source_path = chapter['path']
-            
-            with open(source_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Конвертируем ссылки на главы в относительные якоря
-            def convert_pdf_links(match):
-                section = match.group(1)
-                chapter_num = match.group(2)
-                target_id = f"chapter_{section.zfill(2)}_{chapter_num.zfill(2)}"
-                link_text = f"Глава {section}.{chapter_num}"
-                return f'<a href="#{target_id}">{link_text}</a>'
-            
-            # Заменяем [Глава X.Y](...) на внутренние ссылки
-            content = re.sub(r'\[Глава (\d+)\.(\d+)\]\([^)]+\)', convert_pdf_links, content)
-            content = re.sub(r'\[\*\*Глава (\d+)\.(\d+)\*\*\]\([^)]+\)', lambda m: f'<a href="#chapter_{m.group(1).zfill(2)}_{m.group(2).zfill(2)}"><strong>Глава {m.group(1)}.{m.group(2)}</strong></a>', content)
-            
-            # Конвертируем markdown в HTML с якорями для подразделов
-            md = markdown.Markdown(extensions=['extra', 'codehilite', 'tables', 'toc', 'attr_list'])
-            html_chapter = md.convert(content)
-            
-            # Добавляем ID к подразделам
-            chapter_id = f"chapter_{chapter['section_num']}_{chapter['chapter_num']}"
-            h2_counter = 0
-            
-            def add_h2_id(match):
-                nonlocal h2_counter
-                h2_id = f'{chapter_id}_h2_{h2_counter}'
-                h2_counter += 1
-                return f'<h2 id="{h2_id}">{match.group(1)}</h2>'
-            
-            html_chapter = re.sub(r'<h2>(.+?)</h2>', add_h2_id, html_chapter)
-            
+            chapter_id = chapter.anchor_id
             # Добавляем главу с классом для page-break
-            html_content += f'<div class="chapter" id="{chapter_id}">\n{html_chapter}\n</div>\n\n'
+            parts.append(f'<div class="chapter" id="{chapter_id}">\n{chapter.html}\n</div>\n\n')
+            chapter.html = None
         
-        html_content += "</body></html>"
+        parts.append("</body></html>")
         
         # Генерируем PDF через WeasyPrint с bookmarks
         pdf_path = self.root_dir / "учебник_информатика.pdf"
         
         try:
-            from weasyprint import HTML, CSS
-            from weasyprint.text.fonts import FontConfiguration
+            # Шрифты и CSS создаются при первой сборке и переиспользуются
+            # при повторных вызовах build() на том же экземпляре
+            if self._font_config is None:
+                self._font_config = FontConfiguration()
             
-            font_config = FontConfiguration()
+            if self._bookmark_css is None:
+                # CSS для добавления bookmarks (встроенного оглавления PDF)
+                self._bookmark_css = CSS(string='''
+                    h1 { bookmark-level: 1; bookmark-label: content(); }
+                    h2 { bookmark-level: 2; bookmark-label: content(); }
+                    h3 { bookmark-level: 3; bookmark-label: content(); }
+                ''')
             
-            # CSS для добавления bookmarks (встроенного оглавления PDF)
-            bookmark_css = CSS(string='''
-                h1 { bookmark-level: 1; bookmark-label: content(); }
-                h2 { bookmark-level: 2; bookmark-label: content(); }
-                h3 { bookmark-level: 3; bookmark-label: content(); }
-            ''')
-            
-            HTML(string=html_content).write_pdf(
-                pdf_path,
-                stylesheets=[bookmark_css],
-                font_config=font_config
-            )
+            # HTML книги уходит во временный файл, а не собирается в одну
+            # огромную строку: WeasyPrint и так съедает много памяти
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.html',
+                                             buffering=_PDF_HTML_BUFFER_SIZE) as tmp:
+                tmp.writelines(parts)
+                tmp.flush()
+                parts.clear()
+                
+                HTML(filename=tmp.name).write_pdf(
+                    pdf_path,
+                    stylesheets=[self._bookmark_css],
+                    font_config=self._font_config
+                )
             print(f"  ✅ PDF создан: {pdf_path}")
             print(f"  ✅ Добавлено встроенное оглавление (bookmarks)")
             
@@ -843,8 +1031,7 @@ python build_script.py
 /учебник_информатика/build_script.py linguist-generated=false
 """
         
-        with open(self.root_dir / ".gitattributes", 'w', encoding='utf-8') as f:
-            f.write(gitattributes_content)
+        _write_if_changed(self.root_dir / ".gitattributes", gitattributes_content)
         
         print("  ✅ Создан .gitattributes")
         return True